@@ -5,18 +5,29 @@ This module centralizes configuration values used across the application
 to ensure consistency and ease of maintenance.
 """
 
-from typing import List, Dict
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Tuple
+
+import numpy as np
 
 # Data range
 DATA_START_YEAR: int = 1996
 DATA_END_YEAR: int = 2018
-YEARS: List[int] = list(range(DATA_START_YEAR, DATA_END_YEAR + 1))
+YEARS: Tuple[int, ...] = tuple(range(DATA_START_YEAR, DATA_END_YEAR + 1))
+YEAR_FIELDS: Tuple[str, ...] = tuple(f'F{year}' for year in YEARS)  # Model field names F1996..F2018
+# Graph x-axis, built once so matplotlib doesn't convert YEARS on every plot call
+YEARS_NP: np.ndarray = np.arange(DATA_START_YEAR, DATA_END_YEAR + 1, dtype=np.int16)
 
 # Pagination
 DEFAULT_PAGE_SIZE: int = 200
 MAX_PAGE_SIZE: int = 1000
 MIN_PAGE_SIZE: int = 1
 
+# Caching (datastore is read-only historical data, so results are stable)
+FILTER_CACHE_TIMEOUT: int = 3600  # seconds
+GRAPH_CACHE_TIMEOUT: int = 86400  # seconds; rendered PNGs kept server-side
+GRAPH_BROWSER_MAX_AGE: int = 3600  # seconds; Cache-Control max-age for graphs
+
 # Graph configuration
 GRAPH_COLOR_PALETTE: List[str] = [
     '#6366f1',  # Indigo
@@ -28,9 +39,12 @@ GRAPH_COLOR_PALETTE: List[str] = [
 ]
 
 MAX_SCHOOLS_PER_GRAPH: int = 50  # Limit to prevent performance issues
+GRAPH_FIGURE_POOL_SIZE: int = 4  # Figures kept for reuse per worker process
+GRAPH_RENDER_TIMEOUT: int = 30  # seconds to wait for a render worker
+GRAPH_RENDER_VERSION: int = 1  # bump when plot code changes so cached graphs are re-rendered
 
-# Graph styling (dark theme to match site CSS)
-GRAPH_STYLE: Dict[str, str] = {
+# Graph styling (dark theme to match site CSS); read-only view of the rc settings
+GRAPH_STYLE: Mapping[str, str] = MappingProxyType({
     'figure.facecolor': '#141414',
     'axes.facecolor': '#141414',
     'axes.edgecolor': '#2a2a2a',
@@ -43,7 +57,7 @@ GRAPH_STYLE: Dict[str, str] = {
     'legend.edgecolor': '#2a2a2a',
     'savefig.facecolor': '#141414',
     'savefig.edgecolor': '#141414',
-}
+})
 
 # Field name mappings for display
 FIELD_DISPLAY_NAMES: Dict[str, str] = {
@@ -0,0 +1,177 @@
+"""
+Enrollment graph rendering for school rolls data application.
+
+This module only depends on matplotlib, numpy and constants (not on Django),
+so its render functions can run in worker processes of a
+ProcessPoolExecutor as well as in the request process.
+"""
+
+import io
+import queue
+from typing import List, Tuple
+
+import matplotlib
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .constants import (
+    YEARS,
+    YEARS_NP,
+    GRAPH_COLOR_PALETTE,
+    GRAPH_STYLE,
+    GRAPH_FIGURE_POOL_SIZE,
+)
+
+# Graph style is applied once per process (including each render worker on
+# import) instead of per request via rc_context
+matplotlib.rcParams.update(GRAPH_STYLE)
+
+# Reusable figures; allocating a figure and canvas per request is costly
+_FIGURE_POOL: 'queue.LifoQueue[Figure]' = queue.LifoQueue(maxsize=GRAPH_FIGURE_POOL_SIZE)
+
+
+def _acquire_figure(figsize: Tuple[float, float]) -> Tuple[Figure, Axes]:
+    """
+    Take a figure from the process-local pool, creating one if it is empty.
+    
+    Args:
+        figsize: (width, height) in inches for this render
+        
+    Returns:
+        (Figure, Axes) ready to draw on
+    """
+    try:
+        fig = _FIGURE_POOL.get_nowait()
+    except queue.Empty:
+        # Object-oriented API with an Agg canvas: no pyplot figure manager or
+        # global state, so concurrent requests on worker threads are safe
+        fig = Figure(figsize=figsize, dpi=100)
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot()
+    fig.set_size_inches(figsize)
+    return fig, fig.axes[0]
+
+
+def _release_figure(fig: Figure) -> None:
+    """
+    Reset a figure and return it to the pool, dropping it if the pool is full.
+    
+    Args:
+        fig: Figure previously obtained from _acquire_figure
+    """
+    for ax in fig.axes:
+        ax.clear()
+    # Undo any tight_layout() adjustment so the next render starts from defaults
+    fig.subplots_adjust(**{
+        param: matplotlib.rcParams[f'figure.subplot.{param}']
+        for param in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+    })
+    try:
+        _FIGURE_POOL.put_nowait(fig)
+    except queue.Full:
+        pass  # Not registered with pyplot, so garbage collection frees it
+
+
+def create_empty_graph() -> Figure:
+    """
+    Create a placeholder graph when no schools are selected.
+    
+    Returns:
+        matplotlib Figure object
+    """
+    fig, ax = _acquire_figure((10, 6))
+    ax.text(0.5, 0.5, 'Select schools to view enrollment trends',
+            ha='center', va='center', transform=ax.transAxes, fontsize=14)
+    ax.set_xlim(YEARS[0], YEARS[-1])
+    ax.set_ylim(0, 1000)
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Pupils')
+    ax.set_title('School Enrollment Trends')
+    ax.grid(True, alpha=0.3, color=GRAPH_STYLE['grid.color'])
+    return fig
+
+
+def plot_enrollment_data(names: List[str], enrollments: np.ndarray) -> Figure:
+    """
+    Create enrollment trend plot from fetched data.
+    
+    Args:
+        names: School names, one per row of enrollments
+        enrollments: (n_schools, n_years) float64 array, NaN where no count
+        
+    Returns:
+        matplotlib Figure object
+    """
+    fig, ax = _acquire_figure((12, 6))
+    
+    plotted_count = 0
+    for name, enrollment in zip(names, enrollments):
+        # Skip missing years so the line joins the remaining points
+        valid = ~np.isnan(enrollment)
+        if valid.any():
+            color = GRAPH_COLOR_PALETTE[plotted_count % len(GRAPH_COLOR_PALETTE)]
+            ax.plot(
+                YEARS_NP[valid], enrollment[valid],
+                marker='o', linewidth=2, markersize=4, 
+                label=name, color=color
+            )
+            plotted_count += 1
+    
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Pupils')
+    ax.set_title(
+        f'Enrollment Trends for {plotted_count} Selected School'
+        f'{"s" if plotted_count != 1 else ""}'
+    )
+    ax.grid(True, alpha=0.3, color=GRAPH_STYLE['grid.color'])
+    
+    if plotted_count > 0:
+        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', frameon=True)
+    
+    fig.tight_layout()
+    
+    return fig
+
+
+def render_empty_png() -> bytes:
+    """
+    Render the placeholder graph to PNG bytes.
+    
+    Returns:
+        bytes: PNG image data
+    """
+    return _save_png(create_empty_graph())
+
+
+def render_enrollment_png(names: List[str], enrollments: np.ndarray) -> bytes:
+    """
+    Render the enrollment trend graph to PNG bytes.
+    
+    Args:
+        names: School names, one per row of enrollments
+        enrollments: (n_schools, n_years) float64 array, NaN where no count
+        
+    Returns:
+        bytes: PNG image data
+    """
+    return _save_png(plot_enrollment_data(names, enrollments))
+
+
+def _save_png(fig: Figure) -> bytes:
+    """
+    Save a figure to PNG bytes, then hand it back to the pool.
+    
+    Args:
+        fig: Figure obtained from _acquire_figure
+        
+    Returns:
+        bytes: PNG image data
+    """
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    finally:
+        _release_figure(fig)
+    return buf.getvalue()
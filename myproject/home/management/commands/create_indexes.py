@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from home.models import SchoolRoll
+
+
+class Command(BaseCommand):
+    """
+    Create the indexes declared in SchoolRoll.Meta.indexes.
+
+    SchoolRoll is unmanaged, so migrations never touch the school_rolls
+    table. This command issues CREATE INDEX IF NOT EXISTS for each declared
+    index so the filter and sort paths in data_api can use index scans.
+    """
+
+    help = 'Create SchoolRoll indexes on the datastore database (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default='datastore',
+            help='Database alias to create indexes on (default: datastore)',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        quote = connection.ops.quote_name
+        table = quote(SchoolRoll._meta.db_table)
+
+        with connection.cursor() as cursor:
+            for index in SchoolRoll._meta.indexes:
+                columns = ', '.join(
+                    quote(SchoolRoll._meta.get_field(field).column) for field in index.fields
+                )
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {quote(index.name)} ON {table} ({columns})'
+                )
+                self.stdout.write(f'Ensured index {index.name} ({columns})')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(SchoolRoll._meta.indexes)} indexes ensured on {options["database"]}'
+        ))
@@ -1,6 +1,10 @@
+import operator
 from django.db import models
-from typing import Dict, Any, Optional
-from .constants import YEARS
+from typing import Dict, Any, Optional, Tuple
+from .constants import YEAR_FIELDS
+
+# Reads all year columns from an instance __dict__ in a single C-level call
+_YEAR_GETTER = operator.itemgetter(*YEAR_FIELDS)
 
 
 class SchoolRoll(models.Model):
@@ -43,6 +47,30 @@ class SchoolRoll(models.Model):
     class Meta:
         db_table = 'school_rolls'
         managed = False
+        ordering = ['Name']
+        # Not migrated (managed=False); create with `manage.py create_indexes`
+        indexes = [
+            models.Index(fields=['Name'], name='idx_name'),
+            models.Index(fields=['Sector'], name='idx_sector'),
+            models.Index(fields=['School_Type'], name='idx_school_type'),
+            models.Index(fields=['Sector', 'Name'], name='idx_sector_name'),
+        ]
+
+    @property
+    def enrollments(self) -> Tuple[Optional[int], ...]:
+        """
+        Enrollment counts packed in year order (DATA_START_YEAR..DATA_END_YEAR).
+        
+        Returns:
+            tuple: One entry per year in constants.YEAR_FIELDS, None where
+                   no count was recorded or the field was deferred.
+        """
+        d = self.__dict__
+        try:
+            return _YEAR_GETTER(d)
+        except KeyError:
+            # Some year fields were deferred; fall back to per-field lookup
+            return tuple(d.get(field) for field in YEAR_FIELDS)
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -50,17 +78,19 @@ class SchoolRoll(models.Model):
         
         Returns:
             dict: Dictionary with ObjectId, school metadata, and enrollment
-                  data for years defined in constants.YEARS.
+                  data for years defined in constants.YEAR_FIELDS.
+                  Deferred fields are returned as None rather than
+                  triggering an extra query.
         """
-        d = {
-            'ObjectId': self.ObjectId,
-            'Code': self.Code,
-            'Name': self.Name,
-            'LA_Code': self.LA_Code,
-            'LA_Name': self.LA_Name,
-            'Sector': self.Sector,
-            'School_Type': self.School_Type,
+        # Read straight from __dict__ to skip per-field descriptor lookups
+        d = self.__dict__
+        return {
+            'ObjectId': d.get('ObjectId'),
+            'Code': d.get('Code'),
+            'Name': d.get('Name'),
+            'LA_Code': d.get('LA_Code'),
+            'LA_Name': d.get('LA_Name'),
+            'Sector': d.get('Sector'),
+            'School_Type': d.get('School_Type'),
+            **dict(zip(YEAR_FIELDS, self.enrollments)),
         }
-        for year in YEARS:
-            d[f'F{year}'] = getattr(self, f'F{year}')
-        return d
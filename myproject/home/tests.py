@@ -1,17 +1,59 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from io import StringIO
 from unittest.mock import patch, MagicMock
+from typing import Any, Dict, List, Optional
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import gzip
 import json
+import os
+import signal
+import time
+import numpy as np
 from .models import SchoolRoll
 from .constants import (
     YEARS,
+    YEAR_FIELDS,
+    YEARS_NP,
     DEFAULT_PAGE_SIZE,
     MAX_PAGE_SIZE,
     MAX_SCHOOLS_PER_GRAPH,
     GRAPH_COLOR_PALETTE,
+    EXCLUDED_FIELDS,
+    GRAPH_BROWSER_MAX_AGE,
+    GRAPH_STYLE,
 )
 
 
+def _make_paginator_mock(object_list: Optional[List[Any]] = None, count: int = 0, num_pages: int = 1) -> MagicMock:
+    """Build a stand-in for Paginator whose page() returns a single page of object_list."""
+    mock_paginator = MagicMock()
+    mock_page = MagicMock()
+    mock_page.object_list = object_list if object_list is not None else []
+    mock_page.number = 1
+    mock_paginator.return_value.count = count
+    mock_paginator.return_value.num_pages = num_pages
+    mock_paginator.return_value.page.return_value = mock_page
+    return mock_paginator
+
+
+def _make_school_rows(n: int) -> List[Dict[str, Any]]:
+    """Build n plain row dicts shaped like data_api's QuerySet.values() output."""
+    return [
+        {
+            'ObjectId': str(i),
+            'Name': f'School {i}',
+            'Sector': 'Primary',
+            'School_Type': 'Local Authority',
+            **{field: 100 + i for field in YEAR_FIELDS},
+        }
+        for i in range(n)
+    ]
+
+
 class SchoolRollModelTests(TestCase):
     """Test cases for the SchoolRoll model."""
     
@@ -69,51 +111,65 @@ class SchoolRollModelTests(TestCase):
         self.assertIsNone(result['Code'])
         self.assertIsNone(result['F1996'])
         self.assertEqual(result['F2018'], 200)
+    
+    def test_enrollments_are_packed_in_year_order(self):
+        """Test that enrollments returns one value per year, in YEARS order."""
+        school = SchoolRoll(ObjectId='3', Name='Packed School', F1996=10, F2007=20, F2018=30)
+        
+        enrollments = school.enrollments
+        
+        self.assertEqual(len(enrollments), len(YEARS))
+        self.assertEqual(enrollments[0], 10)
+        self.assertEqual(enrollments[YEARS.index(2007)], 20)
+        self.assertEqual(enrollments[-1], 30)
+        self.assertIsNone(enrollments[1])
+    
+    def test_enrollments_tolerate_deferred_year_fields(self):
+        """Test that enrollments reports deferred year fields as None without querying."""
+        school = SchoolRoll(ObjectId='4', Name='Deferred School', F1996=10)
+        del school.__dict__['F2018']
+        
+        with self.assertNumQueries(0, using='datastore'):
+            enrollments = school.enrollments
+        
+        self.assertEqual(enrollments[0], 10)
+        self.assertIsNone(enrollments[-1])
 
 
 class DataAPITests(TestCase):
     """Test cases for the data_api endpoint."""
     
     def setUp(self):
-        """Set up test client."""
+        """Set up test client and a shared queryset/paginator mock scaffold."""
         self.client = Client()
         self.url = reverse('data_api')
+        cache.clear()
+        
+        objects_patcher = patch('home.views.SchoolRoll.objects')
+        self.mock_objects = objects_patcher.start()
+        self.addCleanup(objects_patcher.stop)
+        self.mock_qs = self.mock_objects.using.return_value.values.return_value
+        
+        # Distinct filter lists come from one raw query on the datastore connection
+        connections_patcher = patch('home.views.connections')
+        mock_connections = connections_patcher.start()
+        self.addCleanup(connections_patcher.stop)
+        self.mock_cursor = mock_connections.__getitem__.return_value.cursor.return_value.__enter__.return_value
+        self.mock_cursor.fetchall.return_value = []
+        
+        paginator_patcher = patch('home.views.Paginator', new=_make_paginator_mock())
+        self.mock_paginator = paginator_patcher.start()
+        self.addCleanup(paginator_patcher.stop)
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_returns_paginated_results(self, mock_objects):
+    def test_data_api_returns_paginated_results(self):
         """Test that API returns properly paginated data."""
-        # Mock the queryset chain
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        # Create mock school objects
-        mock_schools = []
-        for i in range(5):
-            school = MagicMock(spec=SchoolRoll)
-            school.to_dict.return_value = {
-                'ObjectId': str(i),
-                'Name': f'School {i}',
-                'Sector': 'Primary',
-                'School_Type': 'Local Authority',
-                **{f'F{year}': 100 + i for year in YEARS}
-            }
-            mock_schools.append(school)
-        
-        # Mock paginator behavior
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = mock_schools[:3]
-            mock_page.number = 1
-            mock_paginator.return_value.count = 5
-            mock_paginator.return_value.num_pages = 2
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            # Mock distinct queries
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = [
-                ('1', 'School 1'),
-                ('2', 'School 2'),
-            ]
-            
+        mock_schools = _make_school_rows(5)
+        self.mock_cursor.fetchall.return_value = [
+            ('names', '1', 'School 1'),
+            ('names', '2', 'School 2'),
+        ]
+        
+        with patch('home.views.Paginator', new=_make_paginator_mock(mock_schools[:3], count=5, num_pages=2)):
             response = self.client.get(self.url, {'page': 1, 'page_size': 3})
         
         self.assertEqual(response.status_code, 200)
@@ -124,182 +180,157 @@ class DataAPITests(TestCase):
         self.assertEqual(data['total'], 5)
         self.assertEqual(data['total_pages'], 2)
         self.assertEqual(len(data['data']), 3)
+        self.assertEqual(data['data'][0], mock_schools[0])
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_default_page_size(self, mock_objects):
-        """Test that API uses DEFAULT_PAGE_SIZE when not specified."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            response = self.client.get(self.url)
-            
-            # Verify Paginator was called with DEFAULT_PAGE_SIZE
-            mock_paginator.assert_called_once()
-            args = mock_paginator.call_args[0]
-            self.assertEqual(args[1], DEFAULT_PAGE_SIZE)
+    def test_data_api_projects_api_fields(self):
+        """Test that API fetches rows via values() instead of model instances."""
+        self.client.get(self.url)
+        
+        projected = self.mock_objects.using.return_value.values.call_args[0]
+        self.assertIn('ObjectId', projected)
+        self.assertIn('Name', projected)
+        for field in YEAR_FIELDS:
+            self.assertIn(field, projected)
+        for field in EXCLUDED_FIELDS:
+            self.assertNotIn(field, projected)
+        self.mock_objects.using.return_value.all.assert_not_called()
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_clamps_page_size_to_max(self, mock_objects):
-        """Test that API enforces MAX_PAGE_SIZE limit."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            # Request more than MAX_PAGE_SIZE
-            response = self.client.get(self.url, {'page_size': MAX_PAGE_SIZE + 500})
-            
-            # Verify Paginator was called with MAX_PAGE_SIZE (clamped)
-            args = mock_paginator.call_args[0]
-            self.assertEqual(args[1], MAX_PAGE_SIZE)
+    def test_data_api_page_size(self):
+        """Test that API defaults and clamps page_size before paginating."""
+        cases = [
+            ({}, DEFAULT_PAGE_SIZE),
+            ({'page_size': MAX_PAGE_SIZE + 500}, MAX_PAGE_SIZE),
+            ({'page_size': 0}, 1),
+            ({'page_size': 'abc'}, DEFAULT_PAGE_SIZE),
+        ]
+        for params, expected in cases:
+            with self.subTest(params=params):
+                self.mock_paginator.reset_mock()
+                self.client.get(self.url, params)
+                
+                # Verify Paginator was called with the resolved page size
+                self.mock_paginator.assert_called_once()
+                self.assertEqual(self.mock_paginator.call_args[0][1], expected)
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_handles_invalid_page_gracefully(self, mock_objects):
+    def test_data_api_handles_invalid_page_gracefully(self):
         """Test that API handles invalid page numbers gracefully."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            # Test with invalid page values
-            for invalid_page in ['abc', '-1', '999999']:
+        for invalid_page in ['abc', '-1', '999999']:
+            with self.subTest(page=invalid_page):
                 response = self.client.get(self.url, {'page': invalid_page})
                 self.assertEqual(response.status_code, 200)
                 data = json.loads(response.content)
                 # Should default to page 1
                 self.assertEqual(data['page'], 1)
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_filters_by_sector(self, mock_objects):
-        """Test that API correctly filters by sector."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            response = self.client.get(self.url, {'sector': 'Primary'})
-            
-            # Verify filter was called
-            mock_qs.filter.assert_called_once_with(Sector='Primary')
-    
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_filters_by_multiple_schools(self, mock_objects):
-        """Test that API correctly filters by multiple school names."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            response = self.client.get(
-                self.url + '?schools=School1&schools=School2&schools=School3'
-            )
-            
-            # Verify filter was called with list
-            call_args = mock_qs.filter.call_args
-            self.assertIn('Name__in', call_args[1])
-            self.assertEqual(len(call_args[1]['Name__in']), 3)
+    def test_data_api_filters(self):
+        """Test that API filters by sector and by multiple school names."""
+        schools = ['School1', 'School2', 'School3']
+        cases = [
+            ({'sector': 'Primary'}, {'Sector': 'Primary'}),
+            ({'schools': schools}, {'Name__in': schools}),
+        ]
+        for params, expected in cases:
+            with self.subTest(params=params):
+                self.mock_qs.reset_mock()
+                self.client.get(self.url, params)
+                self.mock_qs.filter.assert_called_once_with(**expected)
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_sorting(self, mock_objects):
+    def test_data_api_sorting(self):
         """Test that API correctly applies sorting."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            # Test ascending sort
-            response = self.client.get(self.url, {'sort': 'Name', 'order': 'asc'})
-            mock_qs.order_by.assert_called_with('Name')
-            
-            # Test descending sort
-            mock_qs.reset_mock()
-            mock_paginator.reset_mock()
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            response = self.client.get(self.url, {'sort': 'Sector', 'order': 'desc'})
-            mock_qs.order_by.assert_called_with('-Sector')
+        cases = [
+            ('Name', 'asc', 'Name'),
+            ('Sector', 'desc', '-Sector'),
+        ]
+        for sort, order, expected in cases:
+            with self.subTest(sort=sort, order=order):
+                self.mock_qs.reset_mock()
+                self.client.get(self.url, {'sort': sort, 'order': order})
+                self.mock_qs.order_by.assert_called_with(expected)
     
-    @patch('home.views.SchoolRoll.objects')
-    def test_data_api_prevents_sql_injection_in_sort(self, mock_objects):
+    def test_data_api_caches_distinct_values(self):
+        """Test that distinct filter lists are queried once and then served from cache."""
+        self.mock_cursor.fetchall.return_value = [
+            ('names', '1', 'School 1'),
+            ('sectors', None, 'Primary'),
+            ('types', None, 'Academy'),
+        ]
+        
+        first = json.loads(self.client.get(self.url, {'page': 1}).content)
+        second = json.loads(self.client.get(self.url, {'page': 2}).content)
+        
+        # names, sectors and types come from a single query, run once
+        self.mock_cursor.execute.assert_called_once()
+        self.assertEqual(first['distinct'], second['distinct'])
+        self.assertEqual(second['distinct'], {
+            'names': [{'id': '1', 'name': 'School 1'}],
+            'sectors': ['Primary'],
+            'types': ['Academy'],
+        })
+    
+    def test_data_api_keyset_pagination(self):
+        """Test that the after cursor seeks by ObjectId instead of using Paginator."""
+        rows = _make_school_rows(4)
+        mock_ordered = self.mock_qs.filter.return_value.order_by.return_value
+        mock_ordered.__getitem__.return_value = rows
+        
+        response = self.client.get(self.url, {'after': '10', 'page_size': 3})
+        
+        self.mock_paginator.assert_not_called()
+        self.mock_qs.filter.assert_called_once_with(ObjectId__gt='10')
+        self.mock_qs.filter.return_value.order_by.assert_called_once_with('ObjectId')
+        mock_ordered.__getitem__.assert_called_once_with(slice(None, 4))
+        
+        data = json.loads(response.content)
+        self.assertEqual(len(data['data']), 3)
+        self.assertEqual(data['next_cursor'], rows[2]['ObjectId'])
+    
+    def test_data_api_keyset_last_page_has_no_cursor(self):
+        """Test that next_cursor is null once fewer than page_size + 1 rows remain."""
+        self.mock_qs.order_by.return_value.__getitem__.return_value = _make_school_rows(2)
+        
+        response = self.client.get(self.url, {'after': '', 'page_size': 3})
+        
+        # Empty cursor starts from the beginning without a seek filter
+        self.mock_qs.filter.assert_not_called()
+        data = json.loads(response.content)
+        self.assertEqual(len(data['data']), 2)
+        self.assertIsNone(data['next_cursor'])
+    
+    def test_data_api_json_without_orjson(self):
+        """Test that the stdlib encoder fallback produces the same payload as orjson."""
+        rows = _make_school_rows(3)
+        with patch('home.views.Paginator', new=_make_paginator_mock(rows, count=3)):
+            fast = self.client.get(self.url)
+            with patch('home.views.orjson', None):
+                fallback = self.client.get(self.url)
+        
+        self.assertEqual(fallback['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(fallback.content), json.loads(fast.content))
+        self.assertEqual(json.loads(fallback.content)['data'], rows)
+    
+    def test_data_api_response_is_gzipped(self):
+        """Test that JSON responses are compressed for clients that accept gzip."""
+        rows = _make_school_rows(20)
+        with patch('home.views.Paginator', new=_make_paginator_mock(rows, count=20)):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['data'], rows)
+    
+    def test_data_api_prevents_sql_injection_in_sort(self):
         """Test that API rejects invalid column names in sort parameter."""
-        mock_qs = MagicMock()
-        mock_objects.using.return_value.all.return_value = mock_qs
-        
-        with patch('home.views.Paginator') as mock_paginator:
-            mock_page = MagicMock()
-            mock_page.object_list = []
-            mock_page.number = 1
-            mock_paginator.return_value.count = 0
-            mock_paginator.return_value.num_pages = 1
-            mock_paginator.return_value.page.return_value = mock_page
-            
-            mock_objects.using.return_value.order_by.return_value.values_list.return_value.distinct.return_value = []
-            
-            # Try to inject malicious SQL
-            response = self.client.get(self.url, {'sort': 'Name; DROP TABLE--'})
-            
-            # Should not call order_by with invalid column
-            if mock_qs.order_by.called:
-                # If called, it should only be with valid columns
-                call_args = str(mock_qs.order_by.call_args)
-                self.assertNotIn('DROP', call_args)
-                self.assertNotIn(';', call_args)
+        # Try to inject malicious SQL
+        self.client.get(self.url, {'sort': 'Name; DROP TABLE--'})
+        
+        # Should not call order_by with invalid column
+        if self.mock_qs.order_by.called:
+            # If called, it should only be with valid columns
+            call_args = str(self.mock_qs.order_by.call_args)
+            self.assertNotIn('DROP', call_args)
+            self.assertNotIn(';', call_args)
 
 
+@override_settings(GRAPH_RENDER_WORKERS=0)
 class EnrollmentGraphTests(TestCase):
     """Test cases for the enrollment_graph endpoint."""
     
@@ -307,11 +338,11 @@ class EnrollmentGraphTests(TestCase):
         """Set up test client."""
         self.client = Client()
         self.url = reverse('enrollment_graph')
+        cache.clear()
     
-    @patch('home.views._create_empty_graph')
-    @patch('matplotlib.pyplot.savefig')
-    @patch('matplotlib.pyplot.close')
-    def test_graph_returns_placeholder_when_no_selection(self, mock_close, mock_savefig, mock_empty):
+    @patch('home.graphs.create_empty_graph')
+    @patch('home.graphs._release_figure')
+    def test_graph_returns_placeholder_when_no_selection(self, mock_release, mock_empty):
         """Test that graph returns placeholder when no schools selected."""
         mock_fig = MagicMock()
         mock_empty.return_value = mock_fig
@@ -320,43 +351,87 @@ class EnrollmentGraphTests(TestCase):
         
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'image/png')
-        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={GRAPH_BROWSER_MAX_AGE}')
+        self.assertIn('ETag', response)
         mock_empty.assert_called_once()
     
     @patch('home.views._fetch_enrollment_data')
-    @patch('home.views._plot_enrollment_data')
-    @patch('matplotlib.pyplot.savefig')
-    @patch('matplotlib.pyplot.close')
-    def test_graph_accepts_ids_parameter(self, mock_close, mock_savefig, mock_plot, mock_fetch):
-        """Test that graph endpoint accepts ObjectId parameters."""
-        mock_fig = MagicMock()
-        mock_plot.return_value = mock_fig
-        mock_fetch.return_value = MagicMock()
+    @patch('home.graphs.plot_enrollment_data')
+    @patch('home.graphs._release_figure')
+    def test_graph_selection_parameters(self, mock_release, mock_plot, mock_fetch):
+        """Test that graph endpoint accepts ObjectId and school name parameters."""
+        mock_plot.return_value = MagicMock()
+        mock_fetch.return_value = ([], MagicMock())
+        
+        cases = [
+            # (query string, expected selected_ids, expected selected_schools)
+            ('?ids=1&ids=2&ids=3', ['1', '2', '3'], []),
+            ('?schools=School1&schools=School2', [], ['School1', 'School2']),
+            # ids take precedence over school names
+            ('?ids=1&schools=School1', ['1'], []),
+        ]
+        for query, expected_ids, expected_schools in cases:
+            with self.subTest(query=query):
+                mock_fetch.reset_mock()
+                response = self.client.get(self.url + query)
+                
+                self.assertEqual(response.status_code, 200)
+                mock_fetch.assert_called_once_with(expected_ids, expected_schools)
+    
+    @patch('home.views._render_graph')
+    def test_graph_png_is_cached_per_selection(self, mock_render):
+        """Test that the same selection in any order is rendered once and then served from cache."""
+        mock_render.return_value = b'png-bytes'
         
-        response = self.client.get(self.url + '?ids=1&ids=2&ids=3')
+        first = self.client.get(self.url + '?ids=2&ids=1')
+        second = self.client.get(self.url + '?ids=1&ids=2')
+        other = self.client.get(self.url + '?ids=3')
         
-        self.assertEqual(response.status_code, 200)
-        mock_fetch.assert_called_once()
-        call_args = mock_fetch.call_args[0]  # positional args, not kwargs
-        self.assertEqual(call_args[0], ['1', '2', '3'])  # first positional arg is selected_ids
+        self.assertEqual(mock_render.call_count, 2)
+        self.assertEqual(second.content, b'png-bytes')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertNotEqual(first['ETag'], other['ETag'])
     
-    @patch('home.views._fetch_enrollment_data')
-    @patch('home.views._plot_enrollment_data')
-    @patch('matplotlib.pyplot.savefig')
-    @patch('matplotlib.pyplot.close')
-    def test_graph_accepts_schools_parameter(self, mock_close, mock_savefig, mock_plot, mock_fetch):
-        """Test that graph endpoint accepts school name parameters."""
-        mock_fig = MagicMock()
-        mock_plot.return_value = mock_fig
-        mock_fetch.return_value = MagicMock()
+    @patch('home.views._render_graph')
+    def test_graph_etag_changes_with_render_version(self, mock_render):
+        """Test that a new render version re-renders and stops old ETags from matching."""
+        mock_render.return_value = b'png-bytes'
+        etag = self.client.get(self.url + '?ids=1')['ETag']
         
-        response = self.client.get(self.url + '?schools=School1&schools=School2')
+        with patch('home.views._GRAPH_RENDER_TAG', 'next-version'):
+            response = self.client.get(self.url + '?ids=1', HTTP_IF_NONE_MATCH=etag)
         
         self.assertEqual(response.status_code, 200)
-        mock_fetch.assert_called_once()
-        call_args = mock_fetch.call_args[0]  # positional args
-        self.assertEqual(call_args[0], [])  # selected_ids is empty list
-        self.assertEqual(call_args[1], ['School1', 'School2'])  # selected_schools
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(mock_render.call_count, 2)
+    
+    @patch('home.views._render_graph')
+    def test_graph_returns_not_modified_for_matching_etag(self, mock_render):
+        """Test that a matching If-None-Match short-circuits with 304 and no render."""
+        mock_render.return_value = b'png-bytes'
+        etag = self.client.get(self.url + '?ids=1')['ETag']
+        mock_render.reset_mock()
+        
+        response = self.client.get(self.url + '?ids=1', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 304)
+        mock_render.assert_not_called()
+    
+    @patch('home.views._render_graph')
+    def test_graph_serves_precompressed_png(self, mock_render):
+        """Test that cached PNGs are sent gzipped as stored, or decompressed otherwise."""
+        mock_render.return_value = b'png-bytes' * 100
+        
+        compressed = self.client.get(self.url + '?ids=1', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        plain = self.client.get(self.url + '?ids=1')
+        
+        mock_render.assert_called_once()
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), mock_render.return_value)
+        self.assertTrue(compressed['ETag'].startswith('W/'))
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain.content, mock_render.return_value)
+        self.assertIn('Accept-Encoding', plain['Vary'])
     
     @patch('home.views.SchoolRoll.objects')
     def test_fetch_enrollment_data_limits_schools(self, mock_objects):
@@ -376,33 +451,228 @@ class EnrollmentGraphTests(TestCase):
         filtered_ids = call_args[1]['ObjectId__in']
         self.assertEqual(len(filtered_ids), MAX_SCHOOLS_PER_GRAPH)
     
+    @patch('home.views.SchoolRoll.objects')
+    def test_fetch_enrollment_data_streams_into_array(self, mock_objects):
+        """Test that rows are read via iterator() into an array with NULLs as NaN."""
+        from home.views import _fetch_enrollment_data
+        
+        counts = [None] * len(YEAR_FIELDS)
+        counts[-1] = 150
+        mock_values = mock_objects.using.return_value.filter.return_value.values_list.return_value
+        # A name filter can match more rows than names requested
+        mock_values.iterator.return_value = iter([
+            ('Same Name', *counts),
+            ('Same Name', *counts),
+        ])
+        
+        names, enrollments = _fetch_enrollment_data([], ['Same Name'])
+        
+        mock_values.iterator.assert_called_once_with(chunk_size=MAX_SCHOOLS_PER_GRAPH)
+        self.assertEqual(names, ['Same Name', 'Same Name'])
+        self.assertEqual(enrollments.shape, (2, len(YEAR_FIELDS)))
+        self.assertTrue(np.isnan(enrollments[0, 0]))
+        self.assertEqual(enrollments[1, -1], 150)
+    
     def test_plot_uses_correct_color_palette(self):
         """Test that plotting uses colors from GRAPH_COLOR_PALETTE."""
-        from home.views import _plot_enrollment_data
-        
-        # Create mock queryset with schools
-        mock_schools = []
-        for i in range(3):
-            school = MagicMock()
-            school.Name = f'School {i}'
-            for year in YEARS:
-                setattr(school, f'F{year}', 100 + i * 10)
-            mock_schools.append(school)
-        
-        with patch('matplotlib.pyplot.subplots') as mock_subplots:
+        from home.graphs import plot_enrollment_data
+        
+        names = [f'School {i}' for i in range(3)]
+        enrollments = np.array([[100 + i * 10] * len(YEAR_FIELDS) for i in range(3)], dtype=np.float64)
+        
+        with patch('home.graphs._acquire_figure') as mock_acquire:
             mock_fig = MagicMock()
             mock_ax = MagicMock()
-            mock_subplots.return_value = (mock_fig, mock_ax)
+            mock_acquire.return_value = (mock_fig, mock_ax)
+            
+            fig = plot_enrollment_data(names, enrollments)
+            
+            # Verify plot was called with colors from palette
+            self.assertEqual(mock_ax.plot.call_count, 3)
+            for idx, call in enumerate(mock_ax.plot.call_args_list):
+                kwargs = call[1]
+                expected_color = GRAPH_COLOR_PALETTE[idx % len(GRAPH_COLOR_PALETTE)]
+                self.assertEqual(kwargs['color'], expected_color)
+    
+    def test_plot_skips_missing_years(self):
+        """Test that NULL enrollments are dropped and all-NULL schools are not plotted."""
+        from home.graphs import plot_enrollment_data
+        
+        names = ['Partial School', 'Empty School']
+        enrollments = np.full((2, len(YEAR_FIELDS)), np.nan)
+        enrollments[0, 0], enrollments[0, -1] = 120, 150
+        
+        with patch('home.graphs._acquire_figure') as mock_acquire:
+            mock_ax = MagicMock()
+            mock_acquire.return_value = (MagicMock(), mock_ax)
             
-            with patch('matplotlib.pyplot.rc_context'):
-                fig = _plot_enrollment_data(mock_schools)
+            plot_enrollment_data(names, enrollments)
+        
+        self.assertEqual(mock_ax.plot.call_count, 1)
+        plot_years, plot_values = mock_ax.plot.call_args[0]
+        self.assertEqual(list(plot_years), [YEARS[0], YEARS[-1]])
+        self.assertEqual(list(plot_values), [120, 150])
+        self.assertEqual(mock_ax.plot.call_args[1]['label'], 'Partial School')
+    
+    def test_figures_are_reused_from_pool(self):
+        """Test that a released figure is reset and handed out again."""
+        from home.graphs import _acquire_figure, _release_figure
+        
+        fig, ax = _acquire_figure((12, 6))
+        # Rendered through a standalone Agg canvas, not a pyplot figure manager
+        self.assertIsInstance(fig.canvas, FigureCanvasAgg)
+        ax.plot([1, 2], [3, 4])
+        ax.set_title('Used')
+        _release_figure(fig)
+        
+        reused, reused_ax = _acquire_figure((10, 6))
+        try:
+            self.assertIs(reused, fig)
+            self.assertIs(reused_ax, ax)
+            self.assertEqual(len(reused_ax.lines), 0)
+            self.assertEqual(reused_ax.get_title(), '')
+            self.assertEqual(tuple(reused.get_size_inches()), (10, 6))
+        finally:
+            _release_figure(reused)
+    
+    @override_settings(GRAPH_RENDER_WORKERS=1)
+    def test_graph_renders_in_worker_process(self):
+        """Test that graphs render through the process pool when workers are enabled."""
+        from home import views
+        
+        self.addCleanup(views._reset_render_executor, views._get_render_executor())
+        names = ['School 1']
+        enrollments = np.arange(len(YEAR_FIELDS), dtype=np.float64).reshape(1, -1)
+        
+        with patch('home.views._fetch_enrollment_data', return_value=(names, enrollments)):
+            response = self.client.get(self.url + '?ids=1')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+    
+    @override_settings(GRAPH_RENDER_WORKERS=1)
+    def test_graph_recovers_when_pool_breaks_before_submit(self):
+        """Test that a pool that is broken or shut down before submit() renders inline and is rebuilt."""
+        from home import views
+        
+        names = ['School 1']
+        enrollments = np.arange(len(YEAR_FIELDS), dtype=np.float64).reshape(1, -1)
+        
+        def kill_idle_worker(executor):
+            executor.submit(int).result()  # make sure a worker has started
+            for process in list(executor._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+            deadline = time.monotonic() + 10
+            while not executor._broken and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertTrue(executor._broken)
+        
+        breakers = {
+            'worker killed while idle': kill_idle_worker,
+            # Another thread reset the pool while this one still held it
+            'shut down by another thread': lambda executor: executor.shutdown(wait=True),
+        }
+        for label, break_pool in breakers.items():
+            with self.subTest(label):
+                cache.clear()
+                broken = views._get_render_executor()
+                self.addCleanup(views._reset_render_executor, broken)
+                break_pool(broken)
+                
+                with patch('home.views._fetch_enrollment_data', return_value=(names, enrollments)):
+                    response = self.client.get(self.url + '?ids=1')
                 
-                # Verify plot was called with colors from palette
-                self.assertEqual(mock_ax.plot.call_count, 3)
-                for idx, call in enumerate(mock_ax.plot.call_args_list):
-                    kwargs = call[1]
-                    expected_color = GRAPH_COLOR_PALETTE[idx % len(GRAPH_COLOR_PALETTE)]
-                    self.assertEqual(kwargs['color'], expected_color)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.content.startswith(b'\x89PNG'))
+                rebuilt = views._get_render_executor()
+                self.addCleanup(views._reset_render_executor, rebuilt)
+                self.assertIsNot(rebuilt, broken)
+    
+    @patch('home.views._get_render_executor')
+    def test_graph_times_out_with_503(self, mock_executor):
+        """Test that a render exceeding GRAPH_RENDER_TIMEOUT returns 503 and is not cached."""
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        
+        mock_future = mock_executor.return_value.submit.return_value
+        mock_future.result.side_effect = FutureTimeoutError()
+        
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second.status_code, 503)
+        self.assertNotIn('ETag', first)
+        # The failed render was not cached, so the second request retried it
+        self.assertEqual(mock_executor.return_value.submit.call_count, 2)
+        # Abandoned renders are cancelled rather than left queued in the pool
+        self.assertEqual(mock_future.cancel.call_count, 2)
+
+
+class SchoolRollsTableTestCase(TestCase):
+    """Base for tests that need a real school_rolls table in the datastore."""
+    
+    databases = ['datastore']
+    rows: List[tuple] = []  # (ObjectId, Name, Sector, School_Type) rows to insert
+    
+    def setUp(self):
+        """Create a bare school_rolls table, as the CSV loader would (managed=False)."""
+        self.connection = connections['datastore']
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE school_rolls (ObjectId TEXT, Name TEXT, Sector TEXT, School_Type TEXT)'
+            )
+            if self.rows:
+                cursor.executemany('INSERT INTO school_rolls VALUES (%s, %s, %s, %s)', self.rows)
+    
+    def tearDown(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE school_rolls')
+
+
+class CreateIndexesCommandTests(SchoolRollsTableTestCase):
+    """Test cases for the create_indexes management command."""
+    
+    def test_creates_declared_indexes_idempotently(self):
+        """Test that every Meta.indexes entry is created and re-running is safe."""
+        call_command('create_indexes', stdout=StringIO())
+        call_command('create_indexes', stdout=StringIO())
+        
+        with self.connection.cursor() as cursor:
+            constraints = self.connection.introspection.get_constraints(cursor, 'school_rolls')
+        
+        for index in SchoolRoll._meta.indexes:
+            self.assertIn(index.name, constraints)
+            self.assertEqual(constraints[index.name]['columns'], index.fields)
+
+
+class DistinctValuesQueryTests(SchoolRollsTableTestCase):
+    """Test the combined distinct-values query against a real datastore table."""
+    
+    rows = [
+        ('2', 'Beta School', 'Secondary', 'Academy'),
+        ('1', 'Alpha School', 'Primary', 'Local Authority'),
+        ('3', 'Alpha School', 'Primary', None),
+        ('4', '', '', ''),
+    ]
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+    
+    def test_single_query_returns_sorted_non_empty_lists(self):
+        """Test that names, sectors and types are split out, de-duplicated and sorted."""
+        from home.views import _get_distinct_values
+        
+        with self.assertNumQueries(1, using='datastore'):
+            distinct = _get_distinct_values()
+        
+        self.assertEqual(distinct['names'], [
+            {'id': '1', 'name': 'Alpha School'},
+            {'id': '3', 'name': 'Alpha School'},
+            {'id': '2', 'name': 'Beta School'},
+        ])
+        self.assertEqual(distinct['sectors'], ['Primary', 'Secondary'])
+        self.assertEqual(distinct['types'], ['Academy', 'Local Authority'])
 
 
 class IntegrationTests(TestCase):
@@ -445,6 +715,23 @@ class ConstantsTests(TestCase):
         self.assertEqual(YEARS[-1], 2018)
         self.assertEqual(len(YEARS), 23)
     
+    def test_shared_constants_are_immutable(self):
+        """Test that YEARS and GRAPH_STYLE cannot be mutated by callers."""
+        self.assertIsInstance(YEARS, tuple)
+        with self.assertRaises(TypeError):
+            GRAPH_STYLE['text.color'] = '#000000'
+    
+    def test_years_np_matches_years(self):
+        """Test that the NumPy x-axis array holds the same years as YEARS."""
+        self.assertEqual(YEARS_NP.tolist(), list(YEARS))
+    
+    def test_year_fields_match_years(self):
+        """Test that YEAR_FIELDS mirrors YEARS as model field names."""
+        self.assertEqual(YEAR_FIELDS, tuple(f'F{year}' for year in YEARS))
+        model_fields = {f.name for f in SchoolRoll._meta.fields}
+        for field in YEAR_FIELDS:
+            self.assertIn(field, model_fields)
+    
     def test_pagination_constants_are_valid(self):
         """Test that pagination constants have valid values."""
         self.assertGreater(DEFAULT_PAGE_SIZE, 0)
@@ -1,36 +1,86 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse, HttpRequest
+from django.http import HttpResponse, HttpRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
 from django.db.models import QuerySet
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
 import os
 from django.conf import settings
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .models import SchoolRoll
+from . import graphs
 from .constants import (
-    YEARS,
-    GRAPH_COLOR_PALETTE,
-    GRAPH_STYLE,
+    YEAR_FIELDS,
+    EXCLUDED_FIELDS,
     DEFAULT_PAGE_SIZE,
     MAX_PAGE_SIZE,
     MAX_SCHOOLS_PER_GRAPH,
+    FILTER_CACHE_TIMEOUT,
+    GRAPH_CACHE_TIMEOUT,
+    GRAPH_BROWSER_MAX_AGE,
+    GRAPH_RENDER_TIMEOUT,
+    GRAPH_RENDER_VERSION,
+    GRAPH_STYLE,
+    GRAPH_COLOR_PALETTE,
 )
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-import io
+import numpy as np
+import gzip
+import hashlib
+import json
 import logging
-from typing import List, Optional
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson  # Optional: much faster JSON encoding for large pages
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Columns projected by data_api; rows come back as dicts straight from the cursor.
+# EXCLUDED_FIELDS are left out of the SELECT list entirely rather than dropped later.
+API_FIELDS = tuple(
+    f.name for f in SchoolRoll._meta.fields if f.name not in EXCLUDED_FIELDS
+)
+
+DISTINCT_CACHE_KEY = 'data_api:distinct'
+
+_ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+# Folded into graph ETags and cache keys so a deploy that changes how graphs
+# look invalidates both browser copies and server-side PNGs
+_GRAPH_RENDER_TAG = repr((
+    GRAPH_RENDER_VERSION,
+    sorted(GRAPH_STYLE.items()),
+    GRAPH_COLOR_PALETTE,
+))
+
+# Shared per Django process; created on first graph render (see _get_render_executor)
+_RENDER_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_RENDER_EXECUTOR_LOCK = threading.Lock()
+
 def index(request: HttpRequest) -> HttpResponse:
     return render(request, 'home/index.html')
 
-def data_api(request: HttpRequest) -> JsonResponse:
+def data_api(request: HttpRequest) -> HttpResponse:
     """
     Paginated API for school roll data.
     
+    Two pagination modes are supported. Keyset mode (``after``) is preferred
+    for walking the full dataset since its cost does not grow with depth;
+    offset mode (``page``) is kept for compatibility with existing clients.
+    
     Query params:
+      - after: keyset cursor; return rows with ObjectId greater than this value,
+               ordered by ObjectId (pass an empty value for the first page).
+               When present, page/sort/order are ignored.
       - page: 1-based page number (default: 1)
       - page_size: items per page (default: DEFAULT_PAGE_SIZE, max: MAX_PAGE_SIZE)
       - sort: column name to sort by (default: 'Name')
@@ -39,9 +89,9 @@ def data_api(request: HttpRequest) -> JsonResponse:
       - schools: repeated param to filter by Name
       
     Returns:
-        JsonResponse: Paginated data with metadata
+        HttpResponse: JSON paginated data with metadata
     """
-    qs = SchoolRoll.objects.using('datastore').all()
+    qs = SchoolRoll.objects.using('datastore').values(*API_FIELDS)
 
     # Filtering
     sector = request.GET.get('sector')
@@ -52,6 +102,19 @@ def data_api(request: HttpRequest) -> JsonResponse:
     if selected_schools:
         qs = qs.filter(Name__in=selected_schools)
 
+    # Page size applies to both pagination modes
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))  # Clamp between 1 and MAX
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid page_size parameter: {e}")
+        page_size = DEFAULT_PAGE_SIZE
+
+    # Keyset pagination orders by ObjectId, so skip the sort handling below
+    after = request.GET.get('after')
+    if after is not None:
+        return _keyset_page(qs, after, page_size)
+
     # Sorting
     sort = request.GET.get('sort', 'Name')
     order = request.GET.get('order', 'asc')
@@ -70,13 +133,6 @@ def data_api(request: HttpRequest) -> JsonResponse:
     except (ValueError, TypeError) as e:
         logger.warning(f"Invalid page parameter: {e}")
         page = 1
-    
-    try:
-        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
-        page_size = max(1, min(page_size, MAX_PAGE_SIZE))  # Clamp between 1 and MAX
-    except (ValueError, TypeError) as e:
-        logger.warning(f"Invalid page_size parameter: {e}")
-        page_size = DEFAULT_PAGE_SIZE
 
     paginator = Paginator(qs, page_size)
     try:
@@ -85,23 +141,15 @@ def data_api(request: HttpRequest) -> JsonResponse:
         page_obj = paginator.page(1)
 
     # Build columns list (use DB column names)
-    columns = [f.name for f in SchoolRoll._meta.fields]
+    columns = list(API_FIELDS)
 
-    # Convert objects to dicts
-    data = [obj.to_dict() for obj in page_obj.object_list]
+    # Rows are already dicts from .values(), no model instantiation needed
+    data = list(page_obj.object_list)
 
     # Distinct values for filters (whole table)
-    distinct_names_qs = SchoolRoll.objects.using('datastore').order_by('Name').values_list('ObjectId', 'Name').distinct()
-    distinct_sectors_qs = SchoolRoll.objects.using('datastore').order_by('Sector').values_list('Sector', flat=True).distinct()
-    distinct_types_qs = SchoolRoll.objects.using('datastore').order_by('School_Type').values_list('School_Type', flat=True).distinct()
-
-    distinct = {
-        'names': [{'id': oid, 'name': name} for oid, name in distinct_names_qs if name],
-        'sectors': [s for s in distinct_sectors_qs if s],
-        'types': [t for t in distinct_types_qs if t],
-    }
+    distinct = _get_distinct_values()
 
-    return JsonResponse({
+    return _json_response({
         'page': page_obj.number,
         'page_size': page_size,
         'total': paginator.count,
@@ -111,136 +159,306 @@ def data_api(request: HttpRequest) -> JsonResponse:
         'distinct': distinct,
     })
 
+def _keyset_page(qs: QuerySet, after: str, page_size: int) -> HttpResponse:
+    """
+    Build a keyset (seek) paginated response.
+    
+    Uses WHERE ObjectId > after ORDER BY ObjectId LIMIT page_size + 1, so the
+    database seeks straight to the cursor instead of scanning and discarding
+    OFFSET rows. The extra row only signals whether another page exists.
+    
+    Args:
+        qs: Filtered values() queryset
+        after: ObjectId of the last row already seen ('' for the first page)
+        page_size: Number of rows to return
+        
+    Returns:
+        HttpResponse: JSON rows plus next_cursor (None on the last page)
+    """
+    if after:
+        qs = qs.filter(ObjectId__gt=after)
+    rows = list(qs.order_by('ObjectId')[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    data = rows[:page_size]
+    next_cursor = data[-1]['ObjectId'] if has_more else None
+
+    return _json_response({
+        'after': after,
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+        'columns': list(API_FIELDS),
+        'data': data,
+        'distinct': _get_distinct_values(),
+    })
+
+def _json_response(payload: Dict[str, Any]) -> HttpResponse:
+    """
+    Serialize payload to a JSON response in a single pass.
+    
+    Uses orjson when installed (C implementation, encodes straight to bytes)
+    and falls back to the stdlib encoder otherwise.
+    
+    Args:
+        payload: JSON-serializable response body
+        
+    Returns:
+        HttpResponse: application/json response
+    """
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, cls=DjangoJSONEncoder)
+    return HttpResponse(body, content_type='application/json')
+
+def _get_distinct_values() -> Dict[str, List[Any]]:
+    """
+    Distinct filter values across the whole table, cached between requests.
+    
+    The datastore is unmanaged historical data, so the lists only need
+    rebuilding when the cache entry expires.
+    
+    Returns:
+        dict: 'names' ({id, name} pairs), 'sectors' and 'types' lists
+    """
+    distinct = cache.get(DISTINCT_CACHE_KEY)
+    if distinct is not None:
+        return distinct
+
+    # One round-trip for all three lists: each branch is tagged with the list
+    # it belongs to and the combined result is split back up in Python
+    connection = connections['datastore']
+    quote = connection.ops.quote_name
+    table = quote(SchoolRoll._meta.db_table)
+    object_id, name, sector, school_type = (
+        quote(SchoolRoll._meta.get_field(field).column)
+        for field in ('ObjectId', 'Name', 'Sector', 'School_Type')
+    )
+    sql = (
+        f"SELECT DISTINCT 'names' AS kind, {object_id} AS id, {name} AS value FROM {table} "
+        f"WHERE {name} IS NOT NULL AND {name} <> '' "
+        f"UNION ALL SELECT DISTINCT 'sectors', NULL, {sector} FROM {table} "
+        f"WHERE {sector} IS NOT NULL AND {sector} <> '' "
+        f"UNION ALL SELECT DISTINCT 'types', NULL, {school_type} FROM {table} "
+        f"WHERE {school_type} IS NOT NULL AND {school_type} <> '' "
+        "ORDER BY kind, value, id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+
+    distinct: Dict[str, List[Any]] = {'names': [], 'sectors': [], 'types': []}
+    for kind, oid, value in rows:
+        if kind == 'names':
+            distinct['names'].append({'id': oid, 'name': value})
+        else:
+            distinct[kind].append(value)
+    cache.set(DISTINCT_CACHE_KEY, distinct, FILTER_CACHE_TIMEOUT)
+    return distinct
+
+def _graph_selection(request: HttpRequest) -> Tuple[List[str], List[str]]:
+    """
+    Read the schools to plot from the query string.
+    
+    Returns:
+        (selected_ids, selected_schools); schools is only used when no ids are given
+    """
+    # Support repeated `ids` (ObjectId) or repeated `schools` (Name)
+    selected_ids = request.GET.getlist('ids') or []
+    selected_schools = []
+    if not selected_ids:
+        selected_schools = request.GET.getlist('schools') or []
+    return selected_ids, selected_schools
+
+def _graph_etag(request: HttpRequest) -> str:
+    """
+    Digest of the normalized graph selection, used as ETag and cache key.
+    
+    Selections are truncated to MAX_SCHOOLS_PER_GRAPH (as _fetch_enrollment_data
+    does) and then sorted, since plot order comes from the database rather
+    than from the request. The render tag is included so graphs from an
+    older style or plotting version never revalidate.
+    """
+    selected_ids, selected_schools = _graph_selection(request)
+    normalized = (
+        _GRAPH_RENDER_TAG,
+        sorted(set(selected_ids[:MAX_SCHOOLS_PER_GRAPH])),
+        sorted(set(selected_schools[:MAX_SCHOOLS_PER_GRAPH])),
+    )
+    return hashlib.blake2b(repr(normalized).encode(), digest_size=16).hexdigest()
+
 def enrollment_graph(request: HttpRequest) -> HttpResponse:
     """
     Generate enrollment trend graph for selected schools.
     
+    The dataset is static, so rendered PNGs are cached server-side keyed by
+    the normalized selection and served with an ETag for browser revalidation.
+    Cache entries are gzipped once at render time and sent as-is to clients
+    that accept gzip, so GZipMiddleware does not recompress them per request.
+    
     Query params:
       - ids: Repeated ObjectId values for schools to plot
       - schools: Repeated school names (fallback if ids not provided)
       
     Returns:
-        HttpResponse: PNG image of enrollment trends
+        HttpResponse: PNG image of enrollment trends, or 503 if rendering timed out
     """
-    # Get selected identifiers: support repeated `ids` (ObjectId) or repeated `schools` (Name)
-    selected_ids = request.GET.getlist('ids') or []
-    selected_schools = []
-    if not selected_ids:
-        selected_schools = request.GET.getlist('schools') or []
+    try:
+        return _cached_graph_response(request)
+    except FutureTimeoutError:
+        # Raised through condition() so the 503 never carries the image's ETag
+        logger.error(f"Graph render exceeded {GRAPH_RENDER_TIMEOUT}s")
+        return HttpResponse('Graph rendering timed out', status=503, content_type='text/plain')
 
-    # Create appropriate graph based on selection
-    if not selected_ids and not selected_schools:
-        fig = _create_empty_graph()
-    else:
-        queryset = _fetch_enrollment_data(selected_ids, selected_schools)
-        fig = _plot_enrollment_data(queryset)
+@condition(etag_func=_graph_etag)
+def _cached_graph_response(request: HttpRequest) -> HttpResponse:
+    """
+    Serve the graph PNG from cache, rendering and caching it on a miss.
     
-    # Save plot to bytes buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
+    Raises:
+        concurrent.futures.TimeoutError: Render took longer than GRAPH_RENDER_TIMEOUT
+    """
+    etag = _graph_etag(request)
+    cache_key = f'graph:{etag}'
+    compressed = cache.get(cache_key)
+    if compressed is None:
+        png = _render_graph(*_graph_selection(request))
+        compressed = gzip.compress(png, mtime=0)
+        cache.set(cache_key, compressed, GRAPH_CACHE_TIMEOUT)
     
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    response['Cache-Control'] = 'no-cache'
+    if _ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(compressed, content_type='image/png')
+        response['Content-Encoding'] = 'gzip'
+        # Same weakening GZipMiddleware applies to an encoded representation
+        response['ETag'] = f'W/"{etag}"'
+    else:
+        response = HttpResponse(gzip.decompress(compressed), content_type='image/png')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = f'public, max-age={GRAPH_BROWSER_MAX_AGE}'
     return response
 
-def _fetch_enrollment_data(selected_ids: Optional[List[str]] = None, selected_schools: Optional[List[str]] = None) -> QuerySet[SchoolRoll]:
+def _render_graph(selected_ids: List[str], selected_schools: List[str]) -> bytes:
     """
-    Fetch enrollment data for specified schools.
+    Render the enrollment graph for a selection to PNG bytes.
+    
+    Data is fetched here, in the request process; only the matplotlib work
+    is handed to the render worker pool (or run inline when it is disabled).
     
     Args:
         selected_ids: List of ObjectId values
         selected_schools: List of school names
         
     Returns:
-        QuerySet of SchoolRoll objects
+        bytes: PNG image data
+        
+    Raises:
+        concurrent.futures.TimeoutError: Worker took longer than GRAPH_RENDER_TIMEOUT
     """
-    if selected_ids:
-        # Limit to prevent excessive graph complexity
-        limited_ids = selected_ids[:MAX_SCHOOLS_PER_GRAPH]
-        if len(selected_ids) > MAX_SCHOOLS_PER_GRAPH:
-            logger.warning(f"Requested {len(selected_ids)} schools, limited to {MAX_SCHOOLS_PER_GRAPH}")
-        return SchoolRoll.objects.using('datastore').filter(ObjectId__in=limited_ids)
-    elif selected_schools:
-        limited_schools = selected_schools[:MAX_SCHOOLS_PER_GRAPH]
-        if len(selected_schools) > MAX_SCHOOLS_PER_GRAPH:
-            logger.warning(f"Requested {len(selected_schools)} schools, limited to {MAX_SCHOOLS_PER_GRAPH}")
-        return SchoolRoll.objects.using('datastore').filter(Name__in=limited_schools)
-    return SchoolRoll.objects.using('datastore').none()
+    # Create appropriate graph based on selection
+    if not selected_ids and not selected_schools:
+        render, args = graphs.render_empty_png, ()
+    else:
+        names, enrollments = _fetch_enrollment_data(selected_ids, selected_schools)
+        render, args = graphs.render_enrollment_png, (names, enrollments)
 
+    executor = _get_render_executor()
+    if executor is None:
+        return render(*args)
+    try:
+        future = executor.submit(render, *args)
+    except (BrokenProcessPool, RuntimeError):
+        # A worker died while idle, or another thread already shut this pool
+        # down after it broke; either way submit() refuses new work
+        logger.exception("Graph render pool unavailable, rendering inline")
+        _reset_render_executor(executor)
+        return render(*args)
+    try:
+        return future.result(timeout=GRAPH_RENDER_TIMEOUT)
+    except FutureTimeoutError:
+        # Drop the render if it is still queued so abandoned work doesn't
+        # hold up later requests; one already running can't be stopped
+        future.cancel()
+        raise
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        logger.exception("Graph render pool broke, rendering inline")
+        _reset_render_executor(executor)
+        return render(*args)
 
-def _create_empty_graph() -> Figure:
+def _get_render_executor() -> Optional[ProcessPoolExecutor]:
     """
-    Create a placeholder graph when no schools are selected.
+    Return the process-wide render pool, creating it on first use.
+    
+    Matplotlib drawing is CPU-bound and holds the GIL, so rendering in worker
+    processes frees this process's threads to serve API requests meanwhile.
     
     Returns:
-        matplotlib Figure object
+        ProcessPoolExecutor, or None when settings.GRAPH_RENDER_WORKERS is 0
+        (render inline)
     """
-    with plt.rc_context(GRAPH_STYLE):
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.text(0.5, 0.5, 'Select schools to view enrollment trends',
-                ha='center', va='center', transform=ax.transAxes, fontsize=14)
-        ax.set_xlim(YEARS[0], YEARS[-1])
-        ax.set_ylim(0, 1000)
-        ax.set_xlabel('Year')
-        ax.set_ylabel('Number of Pupils')
-        ax.set_title('School Enrollment Trends')
-        ax.grid(True, alpha=0.3, color=GRAPH_STYLE['grid.color'])
-    return fig
+    global _RENDER_EXECUTOR
+    workers = getattr(settings, 'GRAPH_RENDER_WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _RENDER_EXECUTOR_LOCK:
+        if _RENDER_EXECUTOR is None:
+            # spawn: forking a threaded server process is unsafe, and graphs
+            # imports no Django code so workers need no app setup
+            _RENDER_EXECUTOR = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _RENDER_EXECUTOR
 
+def _reset_render_executor(executor: ProcessPoolExecutor) -> None:
+    """Discard a broken render pool so _get_render_executor builds a new one."""
+    global _RENDER_EXECUTOR
+    with _RENDER_EXECUTOR_LOCK:
+        if _RENDER_EXECUTOR is executor:
+            _RENDER_EXECUTOR = None
+    executor.shutdown(wait=False)
 
-def _plot_enrollment_data(queryset: QuerySet[SchoolRoll]) -> Figure:
+def _fetch_enrollment_data(selected_ids: Optional[List[str]] = None, selected_schools: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray]:
     """
-    Create enrollment trend plot from queryset data.
+    Fetch enrollment data for specified schools.
+    
+    Rows are streamed from the cursor in chunks straight into a pre-sized
+    array, so no intermediate list of rows is built.
     
     Args:
-        queryset: QuerySet of SchoolRoll objects
+        selected_ids: List of ObjectId values
+        selected_schools: List of school names
         
     Returns:
-        matplotlib Figure object
+        (names, enrollments): school names and an (n_schools, n_years)
+        float64 array with NULL enrollments as NaN
     """
-    year_columns = [f'F{year}' for year in YEARS]
-    
-    with plt.rc_context(GRAPH_STYLE):
-        fig, ax = plt.subplots(figsize=(12, 6))
-        
-        plotted_count = 0
-        for obj in queryset:
-            enrollment_data = [getattr(obj, col) for col in year_columns]
-            
-            # Filter out None/null values
-            valid_data = [
-                (year, enrollment) 
-                for year, enrollment in zip(YEARS, enrollment_data) 
-                if enrollment is not None
-            ]
-            
-            if valid_data:
-                plot_years, plot_enrollment = zip(*valid_data)
-                color = GRAPH_COLOR_PALETTE[plotted_count % len(GRAPH_COLOR_PALETTE)]
-                ax.plot(
-                    plot_years, plot_enrollment, 
-                    marker='o', linewidth=2, markersize=4, 
-                    label=obj.Name, color=color
-                )
-                plotted_count += 1
-        
-        ax.set_xlabel('Year')
-        ax.set_ylabel('Number of Pupils')
-        ax.set_title(
-            f'Enrollment Trends for {plotted_count} Selected School'
-            f'{"s" if plotted_count != 1 else ""}'
-        )
-        ax.grid(True, alpha=0.3, color=GRAPH_STYLE['grid.color'])
-        
-        if plotted_count > 0:
-            ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', frameon=True)
-        
-        fig.tight_layout()
-    
-    return fig
+    qs = SchoolRoll.objects.using('datastore')
+    if selected_ids:
+        # Limit to prevent excessive graph complexity
+        limited = selected_ids[:MAX_SCHOOLS_PER_GRAPH]
+        if len(selected_ids) > MAX_SCHOOLS_PER_GRAPH:
+            logger.warning(f"Requested {len(selected_ids)} schools, limited to {MAX_SCHOOLS_PER_GRAPH}")
+        qs = qs.filter(ObjectId__in=limited)
+    elif selected_schools:
+        limited = selected_schools[:MAX_SCHOOLS_PER_GRAPH]
+        if len(selected_schools) > MAX_SCHOOLS_PER_GRAPH:
+            logger.warning(f"Requested {len(selected_schools)} schools, limited to {MAX_SCHOOLS_PER_GRAPH}")
+        qs = qs.filter(Name__in=limited)
+    else:
+        limited = []
+        qs = qs.none()
 
+    names: List[str] = []
+    enrollments = np.empty((len(limited), len(YEAR_FIELDS)), dtype=np.float64)
+    rows = qs.values_list('Name', *YEAR_FIELDS).iterator(chunk_size=MAX_SCHOOLS_PER_GRAPH)
+    for i, (name, *counts) in enumerate(rows):
+        if i == len(enrollments):
+            # Names are not unique, so a name filter can match extra rows
+            enrollments = np.concatenate([enrollments, np.empty_like(enrollments)])
+        names.append(name)
+        enrollments[i] = counts  # None becomes NaN
+    return names, enrollments[:len(names)]
 
 def data_page(request: HttpRequest) -> HttpResponse:
     """Render the main data exploration page."""
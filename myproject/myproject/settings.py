@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compresses JSON API responses (repetitive F1996..F2018 keys shrink well)
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,6 +91,24 @@ DATABASES['datastore'] = {
 }
 
 
+# Graph rendering
+# Worker processes for matplotlib rendering (0 renders inline in the request thread)
+
+GRAPH_RENDER_WORKERS = int(os.environ.get('GRAPH_RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/ref/settings/#caches
+# Process-local cache for query results derived from the static datastore
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'school-rolls',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
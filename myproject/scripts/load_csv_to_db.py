@@ -67,6 +67,7 @@ cursor.execute('CREATE INDEX IF NOT EXISTS idx_name ON school_rolls(Name)')
 cursor.execute('CREATE INDEX IF NOT EXISTS idx_sector ON school_rolls(Sector)')
 cursor.execute('CREATE INDEX IF NOT EXISTS idx_school_type ON school_rolls(School_Type)')
 cursor.execute('CREATE INDEX IF NOT EXISTS idx_objectid ON school_rolls(ObjectId)')
+cursor.execute('CREATE INDEX IF NOT EXISTS idx_sector_name ON school_rolls(Sector, Name)')
 print("Indexes created successfully.")
 
 # Read CSV and insert data
@@ -390,7 +390,9 @@ function updateGraph(){
     graphContent.innerHTML=''; 
     graphContent.appendChild(img);
   } 
-  img.src = graphUrl + '&t='+Date.now(); 
+  // No cache-buster: graph ETags are versioned server-side, so the browser
+  // can reuse or revalidate (304) the previous image for the same selection
+  img.src = graphUrl; 
   img.alt = `Enrollment trends for ${selectedIds.length} selected school${selectedIds.length!==1?'s':''}`; 
   if(DOM.exportBtn()) DOM.exportBtn().disabled=false;
 }